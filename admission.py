@@ -0,0 +1,247 @@
+# admission.py
+import asyncio
+import ipaddress
+import json
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Tuple
+
+# (requests per second, burst) for each route class.
+DEFAULT_LIMITS = {
+    "expensive": (float(os.getenv("RATE_LIMIT_EXPENSIVE_RPS", 2)), int(os.getenv("RATE_LIMIT_EXPENSIVE_BURST", 10))),
+    "images": (float(os.getenv("RATE_LIMIT_IMAGES_RPS", 20)), int(os.getenv("RATE_LIMIT_IMAGES_BURST", 100))),
+    "auth": (float(os.getenv("RATE_LIMIT_AUTH_RPS", 0.5)), int(os.getenv("RATE_LIMIT_AUTH_BURST", 5))),
+    "default": (float(os.getenv("RATE_LIMIT_DEFAULT_RPS", 10)), int(os.getenv("RATE_LIMIT_DEFAULT_BURST", 40))),
+}
+EXPENSIVE_MAX_CONCURRENCY = int(os.getenv("EXPENSIVE_MAX_CONCURRENCY", 8))
+EXPENSIVE_MAX_QUEUE = int(os.getenv("EXPENSIVE_MAX_QUEUE", 16))
+EXPENSIVE_QUEUE_TIMEOUT = float(os.getenv("EXPENSIVE_QUEUE_TIMEOUT", 2))
+# Route classes that hit Mongo hard and share the global concurrency cap.
+CONCURRENCY_LIMITED_CLASSES = frozenset({"expensive"})
+# Peers whose X-Forwarded-For we believe: comma-separated IPs/CIDRs, or "*" for any
+# peer. Defaults to "*" on Vercel (which sets VERCEL=1), whose edge overwrites the
+# header, so clients are not all keyed by the platform hop. Empty trusts nobody;
+# set it explicitly behind any other proxy or load balancer.
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "*" if os.getenv("VERCEL") else "")
+# Untrusted peers sending X-Forwarded-For are reported once each, up to this many.
+MAX_FORWARDER_WARNINGS = 10
+
+ROUTE_CLASSES = (
+    ("/search", "expensive"),
+    ("/auth/search", "expensive"),
+    ("/recommendedProperties", "expensive"),
+    ("/similarProperties", "expensive"),
+    ("/auth/recommendedProperties", "expensive"),
+    ("/auth/similarProperties", "expensive"),
+    ("/properties/financing/recalculate", "expensive"),
+    ("/images/", "images"),
+    ("/token", "auth"),
+    ("/signup", "auth"),
+)
+
+
+def route_class(path: str) -> str:
+    for prefix, name in ROUTE_CLASSES:
+        if path == prefix or (prefix.endswith("/") and path.startswith(prefix)):
+            return name
+    return "default"
+
+
+class RateLimitBackend(ABC):
+    """Token-bucket storage. Subclass to keep buckets somewhere shared, e.g. Redis."""
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Consume one token; returns (allowed, seconds until a token is available)."""
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Buckets in an LRU map; past ``max_buckets`` the least recently used one is dropped."""
+
+    def __init__(self, max_buckets: int = 100000):
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.max_buckets = max_buckets
+
+    async def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            allowed, retry_after = True, 0.0
+        else:
+            self.buckets[key] = (tokens, now)
+            allowed, retry_after = False, (1 - tokens) / rate if rate else 60.0
+        while len(self.buckets) > self.max_buckets:
+            # An evicted client just starts again with a full bucket.
+            self.buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight requests and the number allowed to wait for a slot."""
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def acquire(self) -> bool:
+        if self.active >= self.max_concurrency and self.waiting >= self.max_queue:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self.semaphore.release()
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, app, backend: Optional[RateLimitBackend] = None, limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 limiter: Optional[ConcurrencyLimiter] = None, trusted_proxies: str = TRUSTED_PROXIES):
+        self.app = app
+        self.trusted_proxies = parse_trusted_proxies(trusted_proxies)
+        self.backend = backend or InMemoryRateLimitBackend()
+        self.limits = limits or DEFAULT_LIMITS
+        self.limiter = limiter or ConcurrencyLimiter(EXPENSIVE_MAX_CONCURRENCY, EXPENSIVE_MAX_QUEUE, EXPENSIVE_QUEUE_TIMEOUT)
+        admission_stats.limiter = self.limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        name = route_class(scope["path"])
+        rate, burst = self.limits.get(name, self.limits["default"])
+        allowed, retry_after = await self.backend.take(f"{name}:{client_id(scope, self.trusted_proxies)}", rate, burst)
+        if not allowed:
+            admission_stats.shed[(name, "rate_limited")] += 1
+            await _reject(send, 429, "Too many requests", retry_after)
+            return
+
+        if name not in CONCURRENCY_LIMITED_CLASSES:
+            admission_stats.admitted[name] += 1
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.limiter.acquire():
+            admission_stats.shed[(name, "overloaded")] += 1
+            await _reject(send, 503, "Server busy, retry shortly", 1)
+            return
+        admission_stats.admitted[name] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+
+class AdmissionStats:
+    def __init__(self):
+        self.admitted = Counter()
+        self.shed = Counter()
+        self.limiter: Optional[ConcurrencyLimiter] = None
+
+    def snapshot(self) -> dict:
+        return {
+            "admitted": dict(self.admitted),
+            "shed": {f"{name}:{reason}": count for (name, reason), count in self.shed.items()},
+            "active": self.limiter.active if self.limiter else 0,
+            "waiting": self.limiter.waiting if self.limiter else 0,
+        }
+
+
+admission_stats = AdmissionStats()
+
+
+def parse_trusted_proxies(value: str):
+    """"*" trusts every peer; otherwise a tuple of networks. Invalid entries are ignored."""
+    value = value.strip()
+    if value == "*":
+        return "*"
+    networks = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            print("ignoring invalid TRUSTED_PROXIES entry", entry)
+    return tuple(networks)
+
+
+def _is_trusted(address: str, trusted_proxies) -> bool:
+    if trusted_proxies == "*":
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+_warned_forwarders = set()
+
+
+def _warn_untrusted_forwarder(address: str):
+    # Usually a proxy missing from TRUSTED_PROXIES: every client behind it then
+    # shares one bucket, and one busy client exhausts it for all of them.
+    if address in _warned_forwarders or len(_warned_forwarders) >= MAX_FORWARDER_WARNINGS:
+        return
+    _warned_forwarders.add(address)
+    print(f"admission: ignoring X-Forwarded-For from untrusted peer {address}; "
+          "add it to TRUSTED_PROXIES if it is your proxy")
+
+
+def client_id(scope, trusted_proxies=()) -> str:
+    # Keyed on IP only: tokens are unverified at this point and trivially rotated.
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    headers = dict(scope.get("headers") or [])
+    forwarded = headers.get(b"x-forwarded-for")
+    if not trusted_proxies or not _is_trusted(address, trusted_proxies):
+        if forwarded:
+            _warn_untrusted_forwarder(address)
+        return "ip:" + address
+    if forwarded:
+        # Walk back from our peer through trusted hops; the first untrusted hop is the client.
+        hops = [hop.strip() for hop in forwarded.decode("latin-1").split(",") if hop.strip()]
+        for hop in reversed(hops):
+            address = hop
+            if not _is_trusted(hop, trusted_proxies):
+                break
+    return "ip:" + address
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
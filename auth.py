@@ -8,6 +8,7 @@ from pydantic import BaseModel
 
 from database import user_collection
 from models import User, UserInDB, TokenData, UserModel
+from read_models import AuthUser
 
 SECRET_KEY = "your_secret_key"  # Replace with your secret key
 ALGORITHM = "HS256"
@@ -26,6 +27,11 @@ async def get_user(email: str):
     if user:
         return UserModel(**user)
 
+async def get_auth_user(email: str):
+    user = await user_collection.find_one({"email": email}, {"password": 0})
+    if user:
+        return AuthUser.from_document(user)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -67,8 +73,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         token_data = TokenData(email=email, scopes=scopes)
     except JWTError:
         raise credentials_exception
-    user = await get_user(email=token_data.email)
+    user = await get_auth_user(email=token_data.email)
     if user is None:
         raise credentials_exception
-    print(user)
     return user
\ No newline at end of file
@@ -0,0 +1,108 @@
+# bench_read_models.py
+# End-to-end timing of the property read routes through the ASGI app, against a
+# copy of the old path (validate every document, then let response_model validate
+# the output again). Mongo is replaced by an in-memory collection so only
+# construction and serialization are measured. Reports time, allocation peak and
+# retained memory per request, and the same for building the per-request user.
+# Run: python bench_read_models.py [requests] [properties-per-response]
+import os
+import sys
+import timeit
+import tracemalloc
+from typing import List
+
+os.environ.setdefault("MONGO_DETAILS", "mongodb://localhost:1")
+# The admission middleware would otherwise shed the benchmark's own requests.
+for name in ("EXPENSIVE", "DEFAULT"):
+    os.environ.setdefault(f"RATE_LIMIT_{name}_RPS", "1000000")
+    os.environ.setdefault(f"RATE_LIMIT_{name}_BURST", "1000000")
+
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import crud
+import main
+from crud import add_thumbnails
+from models import Property, UserModel
+from read_models import AuthUser
+
+PROPERTY_DOCUMENT = {**Property.__config__.json_schema_extra["example"], "_id": ObjectId()}
+PROPERTY_DOCUMENT.pop("id", None)
+USER_DOCUMENT = {
+    "_id": str(ObjectId()),
+    "email": "jane@example.com",
+    "full_name": "Jane Doe",
+    "role": "user",
+    "wishlist": [str(ObjectId()) for _ in range(25)],
+    "referral_code": "AB12CD",
+    "phone_number": "123-456-7890",
+    "password": "$2b$12$" + "x" * 53,
+}
+
+
+class InMemoryCollection:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def aggregate(self, pipeline):
+        for document in self.documents:
+            yield {**document, "_id": ObjectId()}
+
+
+baseline = FastAPI()
+
+
+@baseline.get("/search", response_model=List[Property])
+async def validated_search():
+    properties = []
+    async for property in main.property_collection.aggregate([]):
+        property["_id"] = str(property["_id"])
+        properties.append(Property(**property))
+    return add_thumbnails(properties)
+
+
+def allocations(function, iterations):
+    """(peak bytes above the starting point during one call, bytes still held per call)."""
+    function()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    peaks = []
+    for _ in range(iterations):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        function()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return max(peaks), (end - start) / iterations
+
+
+def measure(name, function, iterations):
+    micros = min(timeit.repeat(function, number=iterations, repeat=3)) / iterations * 1e6
+    peak, retained = allocations(function, min(iterations, 20))
+    print(f"{name:<28} {micros:10.1f} us/op   {peak / 1024:9.1f} KiB peak/op   {retained:9.0f} B retained/op")
+    return micros, peak
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    collection = InMemoryCollection([PROPERTY_DOCUMENT] * size)
+    main.property_collection = crud.property_collection = collection
+
+    new, old = TestClient(main.app), TestClient(baseline)
+    assert new.get("/search").json()[0].keys() == old.get("/search").json()[0].keys()
+    results = {
+        "GET /search (validated)": measure("GET /search (validated)", lambda: old.get("/search"), requests),
+        "GET /search": measure("GET /search", lambda: new.get("/search"), requests),
+        "GET /recommendedProperties": measure("GET /recommendedProperties", lambda: new.get("/recommendedProperties"), requests),
+        "UserModel(**doc)": measure("UserModel(**doc)", lambda: UserModel(**USER_DOCUMENT), requests * 40),
+        "AuthUser.from_document": measure("AuthUser.from_document", lambda: AuthUser.from_document(USER_DOCUMENT), requests * 40),
+    }
+    for old_name, new_name, label in (
+        ("GET /search (validated)", "GET /search", f"/search ({size} properties)"),
+        ("UserModel(**doc)", "AuthUser.from_document", "user"),
+    ):
+        (old_micros, old_peak), (new_micros, new_peak) = results[old_name], results[new_name]
+        print(f"{label}: {old_micros / new_micros:.1f}x faster, peak allocation {old_peak / 1024:.1f} -> {new_peak / 1024:.1f} KiB")
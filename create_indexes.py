@@ -0,0 +1,37 @@
+# create_indexes.py
+# Creates every index the API relies on. Run it as a deploy step before new code
+# takes traffic; it exits non-zero when an index cannot be built (for example,
+# addressKey_unique over existing duplicates), unlike the best-effort startup hooks
+# in main.py, which only print and may not run at all on serverless deploys.
+#
+#   python create_indexes.py
+import asyncio
+import sys
+
+from pymongo.errors import PyMongoError
+
+import review_queue
+from ingestion import DUPLICATE_KEY, ensure_indexes as ensure_ingestion_indexes
+from saved_searches import ensure_indexes as ensure_saved_search_indexes
+
+STEPS = (
+    ("ingestion", ensure_ingestion_indexes),
+    ("review queue", review_queue.ensure_indexes),
+    ("saved search", ensure_saved_search_indexes),
+)
+
+
+async def create_indexes():
+    for name, ensure in STEPS:
+        await ensure()
+        print(f"{name} indexes ready")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(create_indexes())
+    except PyMongoError as e:
+        print(f"could not create indexes: {e}", file=sys.stderr)
+        if getattr(e, "code", None) == DUPLICATE_KEY:
+            print("merge the duplicate documents by hand, then run this again", file=sys.stderr)
+        sys.exit(1)
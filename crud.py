@@ -1,7 +1,9 @@
 # crud.py
-from typing import List
+from typing import List, Optional
 from database import property_collection
 from models import Property
+from image_proxy import proxy_url
+from read_models import property_from_db
 import httpx
 import os
 scrapper_url = os.getenv("SCRAPPER_URL", "https://perfecto-scrapper.onrender.com/scrape/")
@@ -12,15 +14,60 @@ async def get_random_properties() -> List[Property]:
     properties = []
     async for property in properties_cursor:
         property["_id"] = str(property["_id"])
-        properties.append(Property(**property))
-    return properties
+        properties.append(property_from_db(property))
+    return add_thumbnails(properties)
 
 async def get_similar_properties() -> List[Property]:
     properties_cursor = property_collection.aggregate([{"$sample": {"size": 3}}])
     properties = []
     async for property in properties_cursor:
         property["_id"] = str(property["_id"])
-        properties.append(Property(**property))
+        properties.append(property_from_db(property))
+    return add_thumbnails(properties)
+
+SEARCH_CONVERTED_FIELDS = ("latitude", "longitude", "homeFacts")
+
+def search_pipeline(match_stage: dict) -> List[dict]:
+    # The numeric conversions are only for matching; stored values are put back
+    # afterwards so results carry the same types as every other property route.
+    return [
+        {"$addFields": {"_stored": {
+            field: {"$ifNull": [f"${field}", "$$REMOVE"]} for field in SEARCH_CONVERTED_FIELDS
+        }}},
+        {"$addFields": {
+            "latitude": {"$toDouble": "$latitude"},
+            "longitude": {"$toDouble": "$longitude"},
+            "homeFacts.lotSize": {
+                "$cond": {
+                    "if": {"$and": [{"$ne": ["$homeFacts.lotSize", None]}, {"$ne": ["$homeFacts.lotSize", ""]}]},
+                    "then": {"$toDouble": "$homeFacts.lotSize"},
+                    "else": "0"
+                }
+            },
+            "homeFacts.yearBuilt": {
+                "$cond": {
+                    "if": {"$and": [{"$ne": ["$homeFacts.yearBuilt", None]}, {"$ne": ["$homeFacts.yearBuilt", ""]}]},
+                    "then": {"$toDouble": "$homeFacts.yearBuilt"},
+                    "else": "0"
+                }
+            }
+        }},
+        {"$match": match_stage},
+        {"$addFields": {
+            field: {"$ifNull": [f"$_stored.{field}", "$$REMOVE"]} for field in SEARCH_CONVERTED_FIELDS
+        }},
+        {"$project": {"_stored": 0}},
+    ]
+
+def add_thumbnails(properties: List[Property]) -> List[Property]:
+    for property in properties:
+        property.thumbnailUrl = proxy_url(property.image)
+    return properties
+
+def annotate_wishlisted(properties: List[Property], wishlist: Optional[List[str]]) -> List[Property]:
+    wishlisted = set(wishlist or [])
+    for property in properties:
+        property.wishlisted = property.id in wishlisted
     return properties
 
 async def fetch_data_from_url(url: str):
@@ -13,5 +13,10 @@ property_collection = database.get_collection("properties")
 user_collection = database.get_collection("users")
 requested_property_collection = database.get_collection("requested_properties")
 referral_collection = database.get_collection("referrals")
+saved_search_collection = database.get_collection("saved_searches")
+notification_collection = database.get_collection("notifications")
+market_stats_collection = database.get_collection("market_stats")
+migration_collection = database.get_collection("migrations")
+counter_collection = database.get_collection("counters")
 
 # print(property_collection, 'xxxxx')
\ No newline at end of file
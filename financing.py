@@ -0,0 +1,85 @@
+# financing.py
+import time
+from typing import List
+
+import numpy as np
+from pymongo import UpdateOne
+
+from database import property_collection
+from models import FinancingPolicy, FinancingRecalculationResult
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def amortized_payments(principal: np.ndarray, annual_rate_percent: float, term_years: float) -> np.ndarray:
+    """Fixed monthly payment for each principal in the array, rounded to cents."""
+    principal = np.asarray(principal, dtype=np.float64)
+    months = int(round(term_years * 12))
+    if months <= 0:
+        raise ValueError("term_years must cover at least one month")
+    monthly_rate = annual_rate_percent / 100 / 12
+    if monthly_rate == 0:
+        payments = principal / months
+    else:
+        growth = (1 + monthly_rate) ** months
+        payments = principal * monthly_rate * growth / (growth - 1)
+    return np.round(np.maximum(payments, 0), 2)
+
+
+def monthly_payment(price: float, down_payment: float, annual_rate_percent: float, term_years: float) -> float:
+    return float(amortized_payments(np.array([price - down_payment]), annual_rate_percent, term_years)[0])
+
+
+def policy_terms(prices: np.ndarray, policy: FinancingPolicy):
+    """Vectorized down payment and monthly payment for a chunk of prices under ``policy``."""
+    prices = np.asarray(prices, dtype=np.float64)
+    down_payments = np.round(prices * policy.downPaymentPercent / 100, 2)
+    payments = amortized_payments(prices - down_payments, policy.annualRate, policy.termYears)
+    return down_payments, payments
+
+
+async def _write_chunk(ids: List, prices: List[float], policy: FinancingPolicy) -> int:
+    down_payments, payments = policy_terms(np.array(prices), policy)
+    requests = [
+        UpdateOne(
+            {"_id": _id},
+            {"$set": {"monthlyPayment": float(payment), "downPayment": float(down_payment), "terms": policy.termYears}},
+        )
+        for _id, down_payment, payment in zip(ids, down_payments.tolist(), payments.tolist())
+    ]
+    result = await property_collection.bulk_write(requests, ordered=False)
+    return result.modified_count
+
+
+async def recalculate_financing(pipeline: List[dict], policy: FinancingPolicy,
+                                chunk_size: int = DEFAULT_CHUNK_SIZE) -> FinancingRecalculationResult:
+    """Apply ``policy`` to every property the search pipeline yields, chunk by chunk."""
+    started = time.perf_counter()
+    matched = modified = skipped = chunks = 0
+    ids, prices = [], []
+    cursor = property_collection.aggregate(pipeline + [{"$project": {"price": 1}}], batchSize=chunk_size)
+    async for property in cursor:
+        price = property.get("price")
+        if not isinstance(price, (int, float)) or price <= 0:
+            skipped += 1
+            continue
+        ids.append(property["_id"])
+        prices.append(price)
+        matched += 1
+        if len(ids) >= chunk_size:
+            modified += await _write_chunk(ids, prices, policy)
+            chunks += 1
+            ids, prices = [], []
+    if ids:
+        modified += await _write_chunk(ids, prices, policy)
+        chunks += 1
+
+    seconds = time.perf_counter() - started
+    return FinancingRecalculationResult(
+        matched=matched,
+        modified=modified,
+        skipped=skipped,
+        chunks=chunks,
+        seconds=round(seconds, 3),
+        propertiesPerSecond=round(matched / seconds, 1) if seconds else None,
+    )
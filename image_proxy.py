@@ -0,0 +1,279 @@
+# image_proxy.py
+import asyncio
+import hashlib
+import hmac
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+from PIL import Image
+
+from auth import SECRET_KEY
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "/tmp/perfecto-image-cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+IMAGE_MAX_SOURCE_BYTES = int(os.getenv("IMAGE_MAX_SOURCE_BYTES", 20 * 1024 * 1024))
+IMAGE_PROXY_WORKERS = int(os.getenv("IMAGE_PROXY_WORKERS", 2))
+IMAGE_PROXY_BASE_URL = os.getenv("IMAGE_PROXY_BASE_URL", "")
+
+VARIANTS = {
+    "thumb": (320, 240),
+    "card": (640, 480),
+    "large": (1600, 1200),
+}
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+ORIGINAL = "original"
+
+
+class ImageProxyError(Exception):
+    pass
+
+
+def sign(url: str, variant: str) -> str:
+    return hmac.new(SECRET_KEY.encode(), f"{variant}:{url}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def verify(url: str, variant: str, signature: str) -> bool:
+    return hmac.compare_digest(sign(url, variant), signature)
+
+
+def proxy_url(url: Optional[str], variant: str = "thumb") -> Optional[str]:
+    """Signed proxy path for ``url``; only URLs we hand out can be fetched through the proxy."""
+    if not url:
+        return None
+    return f"{IMAGE_PROXY_BASE_URL}/images/{variant}/{sign(url, variant)}?url={quote(url, safe='')}"
+
+
+def render_variant(source: bytes, size: Tuple[int, int], image_format: str) -> bytes:
+    """Resize to fit within ``size`` and re-encode. Runs in the process pool."""
+    with Image.open(io.BytesIO(source)) as image:
+        image.draft("RGB", size)
+        image = image.convert("RGBA" if image_format == "WEBP" and image.mode in ("RGBA", "LA", "P") else "RGB")
+        image.thumbnail(size, Image.LANCZOS)
+        output = io.BytesIO()
+        if image_format == "WEBP":
+            image.save(output, image_format, quality=80, method=4)
+        else:
+            image.save(output, image_format, quality=82, optimize=True, progressive=True)
+        return output.getvalue()
+
+
+class DiskLRUCache:
+    """Size-bounded on-disk cache. Files are named ``<key>-<etag>.<ext>``; recency lives in memory.
+
+    Methods do blocking file I/O and are called from worker threads, so the index is locked.
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[str, str, int]]" = OrderedDict()
+        self.total_bytes = 0
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            stem, _, ext = name.rpartition(".")
+            key, _, etag = stem.partition("-")
+            if not key or not etag:
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            files.append((stat.st_mtime, key, path, etag, stat.st_size))
+        for _, key, path, etag, size in sorted(files):
+            self.entries[key] = (path, etag, size)
+            self.total_bytes += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            path, etag, _ = entry
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                self._discard(key)
+                return None
+            self.entries.move_to_end(key)
+            return path, etag
+
+    def put(self, key: str, content: bytes, ext: str) -> Tuple[str, str]:
+        etag = hashlib.sha256(content).hexdigest()[:32]
+        path = os.path.join(self.directory, f"{key}-{etag}.{ext}")
+        # A unique temp file per call: threads can put the same key at the same time.
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(content)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._lock:
+            if key in self.entries:
+                self._discard(key, keep_path=path)
+            self.entries[key] = (path, etag, len(content))
+            self.total_bytes += len(content)
+            self._evict()
+        return path, etag
+
+    def read(self, key: str) -> Optional[bytes]:
+        entry = self.get(key)
+        if entry is None:
+            return None
+        try:
+            with open(entry[0], "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def _discard(self, key: str, keep_path: Optional[str] = None):
+        path, _, size = self.entries.pop(key)
+        self.total_bytes -= size
+        if path != keep_path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self._discard(next(iter(self.entries)))
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def cache_key(url: str, variant: str, image_format: str = "") -> str:
+    return hashlib.sha256(f"{variant}:{image_format}:{url}".encode()).hexdigest()[:40]
+
+
+class ImageProxy:
+    def __init__(self, cache: Optional[DiskLRUCache] = None, workers: int = IMAGE_PROXY_WORKERS):
+        self._cache = cache
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight = {}
+
+    @property
+    def cache(self) -> DiskLRUCache:
+        if self._cache is None:
+            self._cache = DiskLRUCache()
+        return self._cache
+
+    async def _cache_call(self, method: str, *args):
+        # Cache methods touch the disk; keep them off the event loop.
+        return await asyncio.to_thread(lambda: getattr(self.cache, method)(*args))
+
+    def _executor(self):
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def _shared(self, key: str, factory: Callable[[], Awaitable]):
+        """Run ``factory()`` once for concurrent callers with the same key."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one waiter disconnecting does not cancel the work for the others.
+        return await asyncio.shield(task)
+
+    async def _fetch_original(self, url: str) -> bytes:
+        key = cache_key(url, ORIGINAL)
+        source = await self._cache_call("read", key)
+        if source is not None:
+            return source
+        # Variants of one URL (e.g. thumb/webp and thumb/jpeg) share a single download.
+        return await self._shared(key, lambda: self._download(url, key))
+
+    async def _download(self, url: str, key: str) -> bytes:
+        timeout = httpx.Timeout(connect=10.0, read=30.0, write=10.0, pool=10.0)
+        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+            async with client.stream("GET", url) as response:
+                if response.status_code != 200:
+                    raise ImageProxyError(f"origin returned {response.status_code}")
+                if not response.headers.get("content-type", "image/").startswith("image/"):
+                    raise ImageProxyError("origin did not return an image")
+                chunks, received = [], 0
+                async for chunk in response.aiter_bytes():
+                    received += len(chunk)
+                    if received > IMAGE_MAX_SOURCE_BYTES:
+                        raise ImageProxyError("image too large")
+                    chunks.append(chunk)
+        source = b"".join(chunks)
+        await self._cache_call("put", key, source, "bin")
+        return source
+
+    async def _render(self, url: str, variant: str, image_format: str, key: str) -> Tuple[str, str]:
+        source = await self._fetch_original(url)
+        pil_format, _ = FORMATS[image_format]
+        loop = asyncio.get_running_loop()
+        try:
+            content = await loop.run_in_executor(self._executor(), render_variant, source, VARIANTS[variant], pil_format)
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM on a huge image); start a fresh pool next time.
+            self._pool = None
+            raise ImageProxyError(f"image worker crashed: {e}")
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise ImageProxyError(f"could not decode image: {e}")
+        return await self._cache_call("put", key, content, image_format)
+
+    async def get(self, url: str, variant: str, image_format: str) -> Tuple[str, str, str]:
+        """Path, strong ETag and media type for ``url`` rendered as ``variant``."""
+        key = cache_key(url, variant, image_format)
+        cached = await self._cache_call("get", key)
+        if cached is None:
+            # Collapse concurrent misses for the same variant into one fetch and render.
+            cached = await self._shared(key, lambda: self._render(url, variant, image_format, key))
+        path, etag = cached
+        return path, f'"{etag}"', FORMATS[image_format][1]
+
+    async def load(self, url: str, variant: str, image_format: str,
+                   path: Optional[str] = None, etag: Optional[str] = None) -> Tuple[bytes, str]:
+        """Content and ETag of the rendered variant, starting from a ``get`` result if given.
+
+        Another request can evict the file between ``get`` and sending it; that is
+        re-rendered once rather than surfacing as a missing file.
+        """
+        for _ in range(2):
+            if path is None:
+                path, etag, _ = await self.get(url, variant, image_format)
+            try:
+                return await asyncio.to_thread(_read_file, path), etag
+            except FileNotFoundError:
+                path = None
+        raise ImageProxyError("image was evicted before it could be sent")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+image_proxy = ImageProxy()
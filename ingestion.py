@@ -0,0 +1,282 @@
+# ingestion.py
+# Idempotent property ingestion. Each scraped payload gets a normalized address key
+# (unique index) and a content hash; writes are a single upsert that only matches
+# when the hash differs, so re-scraping an unchanged listing never touches the
+# document and concurrent accepts of the same house cannot create duplicates.
+#
+#   python ingestion.py scraper_dump.ndjson [--batch-size 500]
+#   python ingestion.py --backfill-keys
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from database import property_collection
+from migrate_property_types import normalized
+from models import Property
+
+DUPLICATE_KEY = 11000
+
+# Fields we add or that admins edit after ingestion; they never count as scraped content.
+NON_CONTENT_FIELDS = {
+    "_id", "user_id", "wishlisted", "addressKey", "contentHash",
+    "monthlyPayment", "downPayment", "terms",
+}
+
+STREET_SUFFIXES = {
+    "street": "st", "avenue": "ave", "boulevard": "blvd", "drive": "dr", "road": "rd",
+    "court": "ct", "lane": "ln", "place": "pl", "terrace": "ter", "circle": "cir",
+    "highway": "hwy", "parkway": "pkwy", "square": "sq", "trail": "trl",
+    "north": "n", "south": "s", "east": "e", "west": "w",
+    "apartment": "unit", "apt": "unit", "suite": "unit", "ste": "unit", "#": "unit",
+}
+
+
+class IngestStatus:
+    inserted = "inserted"
+    updated = "updated"
+    unchanged = "unchanged"
+
+
+def address_key(data: dict) -> str:
+    """Normalized address used to recognise the same house under slightly different names."""
+    address = data.get("address") or data.get("name")
+    if not address:
+        raise ValueError("Property has no address or name to key on")
+    text = str(address).lower().replace("#", " # ")
+    tokens = re.sub(r"[^a-z0-9# ]+", " ", text).split()
+    postal_code = str(data.get("postalCode") or "").strip().lower()
+    if postal_code and postal_code not in tokens:
+        tokens.append(postal_code)
+    return " ".join(STREET_SUFFIXES.get(token, token) for token in tokens)
+
+
+def content_hash(data: dict) -> str:
+    content = {key: value for key, value in data.items() if key not in NON_CONTENT_FIELDS}
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def normalize_fields(data: dict) -> dict:
+    """Copy of ``data`` with string numerics typed the same way migrate_property_types does."""
+    return normalized({k: v for k, v in data.items() if k not in NON_CONTENT_FIELDS})
+
+
+def prepare(data: dict, validate: bool = True) -> Tuple[str, str, dict]:
+    fields = normalize_fields(data)
+    if validate:
+        # Validate once here; reads trust stored documents (see read_models.py).
+        Property(**fields)
+    key = address_key(fields)
+    digest = content_hash(fields)
+    fields["addressKey"] = key
+    fields["contentHash"] = digest
+    return key, digest, fields
+
+
+async def ensure_indexes():
+    # Partial so documents written before addressKey existed don't collide on null.
+    await property_collection.create_index(
+        "addressKey", unique=True, name="addressKey_unique",
+        partialFilterExpression={"addressKey": {"$exists": True}},
+    )
+    # Used by the fallback lookup for documents that have not been keyed yet.
+    await property_collection.create_index("name", name="name")
+    await property_collection.create_index("address", name="address")
+
+
+async def find_keyed(data: dict, key: str) -> Optional[dict]:
+    """The stored document for ``key``, stamping addressKey on an unkeyed match first.
+
+    Documents written before ingestion existed have no addressKey until
+    ``--backfill-keys`` runs, so they are matched by name or address here instead.
+    """
+    existing = await property_collection.find_one({"addressKey": key})
+    if existing is not None:
+        return existing
+    candidates = [{field: data[field]} for field in ("name", "address") if data.get(field)]
+    if not candidates:
+        return None
+    legacy = await property_collection.find_one({"addressKey": {"$exists": False}, "$or": candidates})
+    if legacy is None:
+        return None
+    try:
+        _, digest, _ = prepare(legacy, validate=False)
+        result = await property_collection.update_one(
+            {"_id": legacy["_id"], "addressKey": {"$exists": False}},
+            {"$set": {"addressKey": key, "contentHash": digest}},
+        )
+    except DuplicateKeyError:
+        # A concurrent ingest keyed this address first.
+        return await property_collection.find_one({"addressKey": key})
+    if result.matched_count == 0:
+        return await property_collection.find_one({"addressKey": key})
+    return {**legacy, "addressKey": key, "contentHash": digest}
+
+
+async def ingest_property(data: dict, user_id: Optional[str] = None) -> Tuple[str, Optional[dict], dict]:
+    """Upsert one scraped payload.
+
+    Returns ``(status, before, after)``; ``before`` is None for inserts and
+    ``after`` is the stored document for inserts and updates.
+    """
+    key, digest, fields = prepare(data)
+    # Checked here rather than left to the unique index: if the index is missing, an
+    # unchanged payload would not match the upsert filter and would insert a copy.
+    existing = await find_keyed(fields, key)
+    if existing is not None and existing.get("contentHash") == digest:
+        return IngestStatus.unchanged, existing, existing
+    on_insert = {"_id": ObjectId()}
+    if user_id is not None:
+        on_insert["user_id"] = user_id
+
+    for _ in range(2):
+        try:
+            before = await property_collection.find_one_and_update(
+                {"addressKey": key, "contentHash": {"$ne": digest}},
+                {"$set": fields, "$setOnInsert": on_insert},
+                upsert=True,
+                return_document=False,
+            )
+        except DuplicateKeyError:
+            # The key exists with this exact hash, or a concurrent ingest just created it.
+            existing = await property_collection.find_one({"addressKey": key})
+            if existing is not None and existing.get("contentHash") == digest:
+                return IngestStatus.unchanged, existing, existing
+            continue
+        if before is None:
+            return IngestStatus.inserted, None, {**fields, **on_insert}
+        return IngestStatus.updated, before, {**before, **fields}
+    raise RuntimeError(f"Could not ingest property {key!r}")
+
+
+async def ingest_many(payloads: List[dict]) -> Dict[str, int]:
+    """Bulk variant of ingest_property for imports; one unordered bulk_write per call."""
+    by_key: Dict[str, Tuple[str, dict]] = {}
+    invalid = 0
+    for data in payloads:
+        try:
+            key, digest, fields = prepare(data)
+        except ValueError:
+            invalid += 1
+            continue
+        # Later payloads for the same address win within a batch.
+        by_key[key] = (digest, fields)
+    counts = {"inserted": 0, "updated": 0, "unchanged": len(payloads) - invalid - len(by_key), "invalid": invalid, "failed": 0}
+    # Drop unchanged payloads up front, as ingest_property does, so they never depend
+    # on the unique index to stop an insert.
+    async for document in property_collection.find({"addressKey": {"$in": list(by_key)}}, {"addressKey": 1, "contentHash": 1}):
+        entry = by_key.get(document["addressKey"])
+        if entry is not None and entry[0] == document.get("contentHash"):
+            del by_key[document["addressKey"]]
+            counts["unchanged"] += 1
+    if not by_key:
+        return counts
+    requests = [
+        UpdateOne(
+            {"addressKey": key, "contentHash": {"$ne": digest}},
+            {"$set": fields, "$setOnInsert": {"_id": ObjectId()}},
+            upsert=True,
+        )
+        for key, (digest, fields) in by_key.items()
+    ]
+    try:
+        result = await property_collection.bulk_write(requests, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for error in details.get("writeErrors", []):
+            if error.get("code") == DUPLICATE_KEY:
+                counts["unchanged"] += 1
+            else:
+                counts["failed"] += 1
+    counts["inserted"] += details.get("nUpserted", 0)
+    counts["updated"] += details.get("nModified", 0)
+    return counts
+
+
+async def backfill_address_keys(batch_size: int = 500) -> Dict[str, int]:
+    """Stamp addressKey/contentHash on documents written before ingestion existed.
+
+    Not validated against Property: an existing document that would fail validation
+    still needs a key, or it stays open to duplicates.
+    """
+    counts = {"keyed": 0, "duplicates": 0, "invalid": 0}
+    cursor = property_collection.find({"addressKey": {"$exists": False}}, batch_size=batch_size)
+    async for document in cursor:
+        try:
+            key, digest, _ = prepare(document, validate=False)
+        except ValueError:
+            counts["invalid"] += 1
+            continue
+        try:
+            await property_collection.update_one(
+                {"_id": document["_id"]}, {"$set": {"addressKey": key, "contentHash": digest}}
+            )
+            counts["keyed"] += 1
+        except DuplicateKeyError:
+            # Another document already owns this address; leave it for manual review.
+            print(f"duplicate address {key!r}: {document['_id']}", file=sys.stderr)
+            counts["duplicates"] += 1
+    return counts
+
+
+async def import_ndjson(path: str, batch_size: int = 500) -> Dict[str, int]:
+    await ensure_indexes()
+    # Bulk upserts only match on addressKey, so key any legacy documents first.
+    print(f"backfilled address keys: {await backfill_address_keys(batch_size)}")
+    totals = {"inserted": 0, "updated": 0, "unchanged": 0, "invalid": 0, "failed": 0}
+    started = time.perf_counter()
+    batch = []
+
+    async def flush():
+        counts = await ingest_many(batch)
+        for name, value in counts.items():
+            totals[name] += value
+        batch.clear()
+        elapsed = time.perf_counter() - started
+        print(f"{sum(totals.values())} records ({sum(totals.values()) / elapsed:.0f}/s): {totals}")
+
+    with open(path, "r", encoding="utf-8") as dump:
+        for line_number, line in enumerate(dump, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                batch.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                print(f"line {line_number}: {e}", file=sys.stderr)
+                totals["invalid"] += 1
+                continue
+            if len(batch) >= batch_size:
+                await flush()
+    if batch:
+        await flush()
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import an NDJSON scraper dump into property_collection.")
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--backfill-keys", action="store_true", help="key existing documents instead of importing")
+    args = parser.parse_args()
+    if args.backfill_keys:
+        async def _backfill():
+            await ensure_indexes()
+            return await backfill_address_keys(args.batch_size)
+        print(f"done: {asyncio.run(_backfill())}")
+        sys.exit(0)
+    if not args.path:
+        parser.error("path is required unless --backfill-keys is given")
+    totals = asyncio.run(import_ndjson(args.path, args.batch_size))
+    print(f"done: {totals}")
+    print("run `python market_stats.py rebuild` to refresh market stats after a bulk import")
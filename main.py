@@ -1,19 +1,27 @@
 # main.py
-from fastapi import FastAPI, HTTPException, Query, Depends, Body, Path
+from fastapi import FastAPI, HTTPException, Query, Depends, Body, Path, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from crud import get_random_properties, get_similar_properties, fetch_data_from_url
+from crud import get_random_properties, get_similar_properties, fetch_data_from_url, annotate_wishlisted, search_pipeline, add_thumbnails
 from bson import ObjectId
-from database import property_collection, user_collection, requested_property_collection, referral_collection  
-from models import Property, ContactForm, User, UserInDB, Token, RequestedProperty,AddressList, AcceptPropertyRequest
+from database import property_collection, user_collection, requested_property_collection, referral_collection, saved_search_collection, notification_collection, market_stats_collection
+from models import Property, ContactForm, User, UserInDB, Token, RequestedProperty,AddressList, AcceptPropertyRequest, ListingStatus, SavedSearch, SavedSearchCreate, Notification, MarketStats, FinancingPolicy, FinancingRecalculationResult, PropertyStatus, ReviewQueuePage
+from financing import recalculate_financing
+from admission import AdmissionControlMiddleware, admission_stats
+from image_proxy import ImageProxyError, VARIANTS, image_proxy, verify as verify_image_signature
+from ingestion import IngestStatus, ingest_property, ensure_indexes as ensure_ingestion_indexes
+from market_stats import apply_property_change, stats_fields, to_market_stats
+import review_queue
+from read_models import PropertyResponse, property_from_db
+from saved_searches import ensure_indexes as ensure_saved_search_indexes, normalize_filters, notify_saved_searches, saved_search_index
 from auth import authenticate_user, create_access_token, get_current_user, get_password_hash
 import uvicorn
-from typing import List, Optional
+import httpx
+from typing import List, Optional, Dict
 import os
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from enum import Enum
 import re
 from datetime import timedelta
 import string
@@ -21,15 +29,11 @@ import random
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-class PropertyStatus(str, Enum):
-    coming_soon = "Coming Soon"
-    active = "Active"
-    sold = "Sold"
-    pending = "Pending"
-
-
 app = FastAPI()
 
+# Rate limits and load shedding; added before CORS so rejections still carry CORS headers.
+app.add_middleware(AdmissionControlMiddleware)
+
 # Allow all origins
 app.add_middleware(
     CORSMiddleware,
@@ -40,6 +44,26 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def create_ingestion_indexes():
+    try:
+        await ensure_ingestion_indexes()
+    except Exception as e:
+        # Best effort only; deploys run create_indexes.py, which fails loudly.
+        print("could not create ingestion indexes; run python create_indexes.py", e)
+
+@app.on_event("startup")
+async def create_saved_search_indexes():
+    try:
+        await ensure_saved_search_indexes()
+    except Exception as e:
+        print("could not create saved search indexes; run python create_indexes.py", e)
+
+@app.on_event("shutdown")
+async def stop_image_proxy():
+    image_proxy.shutdown()
+
+
 @app.post("/signup", response_model=User)
 async def create_user(user: UserInDB, referral_code: Optional[str] = None):
     existing_user = await user_collection.find_one({"email": user.email})
@@ -92,21 +116,35 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 @app.get("/users/me", response_model=User)
 async def read_users_me(current_user: User = Depends(get_current_user)):
-    return current_user
+    return current_user.to_dict()
 
 @app.get("/recommendedProperties", response_model=List[Property])
 async def recommended_properties():
     properties = await get_random_properties()
     if not properties:
         raise HTTPException(status_code=404, detail="No properties found")   
-    return properties
+    return PropertyResponse(properties)
 
 @app.get("/similarProperties", response_model=List[Property])
 async def similar_properties():
     properties = await get_similar_properties()
     if not properties:
         raise HTTPException(status_code=404, detail="No properties found")
-    return properties
+    return PropertyResponse(properties)
+
+@app.get("/auth/recommendedProperties", response_model=List[Property])
+async def recommended_properties_auth(current_user: User = Depends(get_current_user)):
+    properties = await get_random_properties()
+    if not properties:
+        raise HTTPException(status_code=404, detail="No properties found")
+    return PropertyResponse(annotate_wishlisted(properties, current_user.wishlist))
+
+@app.get("/auth/similarProperties", response_model=List[Property])
+async def similar_properties_auth(current_user: User = Depends(get_current_user)):
+    properties = await get_similar_properties()
+    if not properties:
+        raise HTTPException(status_code=404, detail="No properties found")
+    return PropertyResponse(annotate_wishlisted(properties, current_user.wishlist))
 
 @app.get("/property/{property_id}", response_model=Property)
 async def get_property(property_id: str):
@@ -117,13 +155,10 @@ async def get_property(property_id: str):
     if document is None:
         raise HTTPException(status_code=404, detail="Property not found")
     
-    document["_id"] = str(document["_id"])
+    return PropertyResponse(property_from_db(document))
 
-    return document
 
-
-@app.get("/search", response_model=List[Property])
-async def search_properties(
+def build_search_match(
     address: Optional[str] = Query(None),
     city: Optional[str] = Query(None),
     minPrice: Optional[float] = Query(None),
@@ -134,7 +169,7 @@ async def search_properties(
     maxBaths: Optional[int] = Query(None),
     minSqft: Optional[int] = Query(None),
     maxSqft: Optional[int] = Query(None),
-    status: Optional[List[PropertyStatus]] = Query(None),
+    status: Optional[List[ListingStatus]] = Query(None),
     minLotSize: Optional[int] = Query(None),
     maxLotSize: Optional[int] = Query(None),
     minYearBuilt: Optional[int] = Query(None),
@@ -143,7 +178,7 @@ async def search_properties(
     maxLat: Optional[float] = None,
     minLng: Optional[float] = None,
     maxLng: Optional[float] = None,
-):
+) -> dict:
     match_stage = {}
 
     if address:
@@ -211,34 +246,67 @@ async def search_properties(
     elif maxLng is not None:
         match_stage["longitude"] = {"$lte": maxLng}
     
-    pipeline = [
-        {"$addFields": {
-            "latitude": {"$toDouble": "$latitude"},
-            "longitude": {"$toDouble": "$longitude"},
-            "homeFacts.lotSize": {
-                "$cond": {
-                    "if": {"$and": [{"$ne": ["$homeFacts.lotSize", None]}, {"$ne": ["$homeFacts.lotSize", ""]}]},
-                    "then": {"$toDouble": "$homeFacts.lotSize"},
-                    "else": "0"
-                }
-            },
-            "homeFacts.yearBuilt": {
-                "$cond": {
-                    "if": {"$and": [{"$ne": ["$homeFacts.yearBuilt", None]}, {"$ne": ["$homeFacts.yearBuilt", ""]}]},
-                    "then": {"$toDouble": "$homeFacts.yearBuilt"},
-                    "else": "0"
-                }
-            }
-        }},
-        {"$match": match_stage}
-    ]
+    return match_stage
+
+
+async def find_properties(match_stage: dict) -> List[Property]:
+    pipeline = search_pipeline(match_stage)
 
     properties = []
     async for property in property_collection.aggregate(pipeline):
         property["_id"] = str(property["_id"])
-        properties.append(Property(**property))
+        properties.append(property_from_db(property))
     
-    return properties
+    return add_thumbnails(properties)
+
+
+@app.get("/search", response_model=List[Property])
+async def search_properties(match_stage: dict = Depends(build_search_match)):
+    return PropertyResponse(await find_properties(match_stage))
+
+@app.get("/auth/search", response_model=List[Property])
+async def search_properties_auth(match_stage: dict = Depends(build_search_match), current_user: User = Depends(get_current_user)):
+    properties = await find_properties(match_stage)
+    return PropertyResponse(annotate_wishlisted(properties, current_user.wishlist))
+
+
+@app.get("/admission/stats", response_model=dict)
+async def get_admission_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return admission_stats.snapshot()
+
+@app.get("/marketStats/{area_type}/{area}", response_model=MarketStats)
+async def get_market_stats(area_type: str = Path(..., regex="^(city|postalCode)$"), area: str = Path(...)):
+    document = await market_stats_collection.find_one({"_id": f"{area_type}:{area}"})
+    if document is None:
+        raise HTTPException(status_code=404, detail="No market stats for this area")
+    return to_market_stats(document)
+
+
+@app.get("/images/{variant}/{signature}")
+async def proxy_image(request: Request, variant: str, signature: str, url: str = Query(...)):
+    if variant not in VARIANTS:
+        raise HTTPException(status_code=404, detail="Unknown image variant")
+    if not verify_image_signature(url, variant, signature):
+        raise HTTPException(status_code=403, detail="Invalid image signature")
+
+    image_format = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    try:
+        path, etag, media_type = await image_proxy.get(url, variant, image_format)
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            content = None
+        else:
+            # Read here rather than FileResponse(path): the file can be evicted before it is sent.
+            content, etag = await image_proxy.load(url, variant, image_format, path, etag)
+    except (ImageProxyError, httpx.HTTPError) as e:
+        raise HTTPException(status_code=502, detail=f"Could not load image: {e}")
+
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400", "Vary": "Accept"}
+    if content is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content, media_type=media_type, headers=headers)
 
 
 @app.post("/contact")
@@ -292,6 +360,7 @@ async def submit_addresses(address_list: AddressList,  current_user: dict = Depe
         await requested_property_collection.insert_one(requested_property)
         requested_properties.append(RequestedProperty(**requested_property))
 
+    await review_queue.adjust_counts({"pending": len(requested_properties)})
     return requested_properties
 
 @app.get("/requestedProperties", response_model=List[RequestedProperty])
@@ -306,6 +375,62 @@ async def get_requested_properties(status: str = "pending", current_user: dict =
     
     return requested_properties
 
+# saved search apis
+@app.post("/savedSearches", response_model=SavedSearch)
+async def create_saved_search(saved_search: SavedSearchCreate, current_user: User = Depends(get_current_user)):
+    filters = normalize_filters(saved_search.filters)
+    if not filters:
+        raise HTTPException(status_code=400, detail="Saved search needs at least one filter")
+
+    document = {
+        "_id": str(ObjectId()),
+        "user_id": str(current_user.id),
+        "name": saved_search.name,
+        "filters": filters,
+    }
+    await saved_search_collection.insert_one(document)
+    saved_search_index.add(document)
+    return SavedSearch(**document)
+
+@app.get("/savedSearches", response_model=List[SavedSearch])
+async def get_saved_searches(current_user: User = Depends(get_current_user)):
+    saved_searches = []
+    async for document in saved_search_collection.find({"user_id": str(current_user.id)}):
+        saved_searches.append(SavedSearch(**document))
+    return saved_searches
+
+@app.delete("/savedSearches/{saved_search_id}", response_model=dict)
+async def delete_saved_search(saved_search_id: str, current_user: User = Depends(get_current_user)):
+    result = await saved_search_collection.delete_one({"_id": saved_search_id, "user_id": str(current_user.id)})
+    if not result.deleted_count:
+        raise HTTPException(status_code=404, detail="Saved search not found")
+    saved_search_index.remove(saved_search_id)
+    return {"message": "Saved search deleted"}
+
+@app.get("/notifications", response_model=List[Notification])
+async def get_notifications(unread_only: bool = False, limit: int = Query(50, le=200), current_user: User = Depends(get_current_user)):
+    query = {"user_id": str(current_user.id)}
+    if unread_only:
+        query["read"] = False
+    notifications = []
+    async for document in notification_collection.find(query).sort("created_at", -1).limit(limit):
+        notifications.append(Notification(**document))
+    return notifications
+
+@app.get("/reviewQueue", response_model=ReviewQueuePage)
+async def get_review_queue(
+    status: PropertyStatus = PropertyStatus.pending,
+    user_id: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    items, next_cursor = await review_queue.fetch_page(status.value, limit, after=after, user_id=user_id)
+    return ReviewQueuePage(items=items, nextCursor=next_cursor, counts=await review_queue.get_counts())
+
 # wishlist apis
 @app.post("/wishlist/add/{property_id}", response_model=User)
 async def add_to_wishlist(property_id: str, current_user: User = Depends(get_current_user)):
@@ -320,7 +445,7 @@ async def add_to_wishlist(property_id: str, current_user: User = Depends(get_cur
         {"$push": {"wishlist": property_id}}
     )
     current_user.wishlist.append(property_id)
-    return current_user
+    return current_user.to_dict()
 
 @app.post("/wishlist/remove/{property_id}", response_model=User)
 async def remove_from_wishlist(property_id: str, current_user: User = Depends(get_current_user)):
@@ -336,7 +461,12 @@ async def remove_from_wishlist(property_id: str, current_user: User = Depends(ge
     )
 
     current_user.wishlist.remove(property_id)
-    return current_user
+    return current_user.to_dict()
+
+@app.post("/wishlist/check", response_model=Dict[str, bool])
+async def check_wishlist(property_ids: List[str] = Body(...), current_user: User = Depends(get_current_user)):
+    wishlisted = set(current_user.wishlist or [])
+    return {property_id: property_id in wishlisted for property_id in property_ids}
 
 @app.get("/wishlist", response_model=List[Property])
 async def get_wishlist(current_user: User = Depends(get_current_user)):
@@ -345,8 +475,8 @@ async def get_wishlist(current_user: User = Depends(get_current_user)):
         document = await property_collection.find_one({"_id": ObjectId(property_id)})
         if document:
             document["_id"] = str(document["_id"])
-            properties.append(Property(**document))
-    return properties
+            properties.append(property_from_db(document))
+    return PropertyResponse(add_thumbnails(properties))
 
 @app.post("/property/{property_id}/reject", response_model=dict)
 async def reject_requested_property(property_id: str = Path(..., description="The ID of the requested property to reject"),
@@ -354,15 +484,18 @@ async def reject_requested_property(property_id: str = Path(..., description="Th
     if current_user.role != 'admin':
         raise HTTPException(status_code=403, detail="Only admins can reject properties")
 
-    updated_property = await requested_property_collection.find_one_and_update(
+    updates = {"status": "rejected"}
+    original_property = await requested_property_collection.find_one_and_update(
         {"_id": str(property_id)},
-        {"$set": {"status": "rejected"}},
-        return_document=True
+        {"$set": updates},
+        return_document=False
     )
 
-    if not updated_property:
+    if not original_property:
         raise HTTPException(status_code=404, detail="Requested property not found")
 
+    await review_queue.move(original_property.get("status"), updates["status"])
+    updated_property = {**original_property, **updates}
     updated_property["_id"] = str(updated_property["_id"])
     return updated_property
 
@@ -375,10 +508,19 @@ async def get_property(property_id: str, current_user: User = Depends(get_curren
     if document is None:
         raise HTTPException(status_code=404, detail="Property not found")
     
-    document["_id"] = str(document["_id"])
-    wishlist = current_user.wishlist
-    document["wishlisted"] = str(document["_id"]) in wishlist
-    return document
+    property = property_from_db(document)
+    property.wishlisted = property.id in (current_user.wishlist or [])
+    return PropertyResponse(property)
+
+
+async def apply_accept_effects(effects: dict):
+    """Market stats and saved-search alerts for an accepted listing; safe to run again."""
+    await apply_property_change(effects.get("old"), effects.get("new"), change_id=effects["changeId"])
+    if effects.get("notifyPropertyId"):
+        # Notification ids are derived from search and property, so re-sending is a no-op.
+        property = await property_collection.find_one({"_id": ObjectId(effects["notifyPropertyId"])})
+        if property is not None:
+            await notify_saved_searches(property)
 
 
 @app.post("/property/{property_id}/accept", response_model=dict)
@@ -390,24 +532,44 @@ async def accept_requested_property(
     if current_user.role != 'admin':
         raise HTTPException(status_code=403, detail="Only admins can reject properties")
 
+    requested_property = await requested_property_collection.find_one({"_id": str(property_id)})
+    if not requested_property:
+        raise HTTPException(status_code=404, detail="Requested property not found")
+    if requested_property.get("pendingEffects"):
+        # An earlier attempt ingested the listing but failed before finishing these.
+        await apply_accept_effects(requested_property["pendingEffects"])
+
     data = await fetch_data_from_url(request_data.url)
-    property_name = data.get('name')
-    property_exists = await property_collection.find_one({"name": property_name})
-    
-    if not property_exists:
-        data["user_id"] = current_user.id
-        new_property = await property_collection.insert_one(data)
-        
+    try:
+        ingest_status, previous_property, stored_property = await ingest_property(data, user_id=current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if ingest_status != IngestStatus.unchanged:
+        # Recorded before running: a retry sees the listing as unchanged, so this is
+        # the only trace of the stats and alerts still owed.
+        effects = {
+            "changeId": str(ObjectId()),
+            "old": stats_fields(previous_property) if ingest_status == IngestStatus.updated else None,
+            "new": stats_fields(stored_property),
+            "notifyPropertyId": str(stored_property["_id"]) if ingest_status == IngestStatus.inserted else None,
+        }
+        await requested_property_collection.update_one({"_id": str(property_id)}, {"$set": {"pendingEffects": effects}})
+        await apply_accept_effects(effects)
 
-    updated_property = await requested_property_collection.find_one_and_update(
+    updates = {"status": "accepted", "reviewed_by": current_user.id}
+    original_property = await requested_property_collection.find_one_and_update(
         {"_id": str(property_id)},
-        {"$set": {"status": "accepted", "user_id": current_user.id}},
-        return_document=True
+        {"$set": updates, "$unset": {"pendingEffects": ""}},
+        return_document=False
     )
 
-    if not updated_property:
+    if not original_property:
         raise HTTPException(status_code=404, detail="Requested property not found")
 
+    await review_queue.move(original_property.get("status"), updates["status"])
+    updated_property = {**original_property, **updates}
+    updated_property.pop("pendingEffects", None)
     updated_property["_id"] = str(updated_property["_id"])
     return updated_property
 
@@ -417,6 +579,7 @@ async def update_property_details(
     monthly_payment: float = Body(...),
     down_payment: float = Body(...),
     terms: float = Body(...),
+    price: Optional[float] = Body(None),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != 'admin':
@@ -425,18 +588,34 @@ async def update_property_details(
     if not ObjectId.is_valid(property_id):
         raise HTTPException(status_code=400, detail="Invalid property ID format")
 
-    updated_property = await property_collection.find_one_and_update(
+    updates = {"monthlyPayment": monthly_payment, "downPayment": down_payment, "terms": terms}
+    if price is not None:
+        updates["price"] = price
+
+    original_property = await property_collection.find_one_and_update(
         {"_id": ObjectId(property_id)},
-        {"$set": {"monthlyPayment": monthly_payment, "downPayment": down_payment, "terms": terms}},
-        return_document=True
+        {"$set": updates},
+        return_document=False
     )
     
-    if not updated_property:
+    if not original_property:
         raise HTTPException(status_code=404, detail="Property not found")
 
+    updated_property = {**original_property, **updates}
+    if price is not None and price != original_property.get("price"):
+        await apply_property_change(original_property, updated_property)
+
     updated_property["_id"] = str(updated_property["_id"])
     return updated_property
 
+@app.post("/properties/financing/recalculate", response_model=FinancingRecalculationResult)
+async def recalculate_property_financing(policy: FinancingPolicy, current_user: User = Depends(get_current_user)):
+    if current_user.role != 'admin':
+        raise HTTPException(status_code=403, detail="Only admins can update property details")
+
+    match_stage = {} if policy.allProperties else build_search_match(**policy.filters.dict())
+    return await recalculate_financing(search_pipeline(match_stage), policy, chunk_size=policy.chunkSize)
+
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))  # Default to port 8000 if PORT is not set
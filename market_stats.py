@@ -0,0 +1,212 @@
+# market_stats.py
+# Materialized market statistics per city and postal code. Stats documents hold
+# additive counters and price histograms so inserts and reprices are a single $inc
+# per area. Backfill with: python market_stats.py rebuild
+import asyncio
+import math
+import sys
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from database import database, property_collection, market_stats_collection
+from models import MarketStats
+
+AREA_FIELDS = ("city", "postalCode")
+# Everything property_contribution and property_areas read.
+STATS_FIELDS = AREA_FIELDS + ("price", "sqft", "propertyListingDetails")
+# Recent change ids kept per stats document so a re-run change is not counted twice.
+APPLIED_CHANGES_KEPT = 200
+# Histogram buckets keep three significant figures, so medians are within ~0.5%.
+HISTOGRAM_PRECISION = 3
+
+
+def _to_float(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(str(value).replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _bucket(value: float) -> str:
+    """Histogram key for ``value`` rounded to HISTOGRAM_PRECISION significant figures.
+
+    Keys become field names under $inc, so they cannot contain ".": values that
+    need decimals use an exponent instead ("123e-1" for 12.34).
+    """
+    if value <= 0:
+        return "0"
+    digits = HISTOGRAM_PRECISION - int(math.floor(math.log10(value))) - 1
+    if digits <= 0:
+        return str(int(round(value, digits)))
+    return f"{int(round(value * 10 ** digits))}e-{digits}"
+
+
+def stats_fields(property: dict) -> dict:
+    """The part of ``property`` its stats depend on, small enough to store for a later re-run."""
+    return {field: property[field] for field in STATS_FIELDS if field in property}
+
+
+def stats_id(area_type: str, area: str) -> str:
+    return f"{area_type}:{area}"
+
+
+def property_contribution(property: dict) -> Dict[str, float]:
+    """Counter increments one property adds to each of its areas."""
+    contribution = {"count": 1}
+    price = _to_float(property.get("price"))
+    sqft = _to_float(property.get("sqft"))
+    if price is not None:
+        contribution["priceCount"] = 1
+        contribution["priceSum"] = price
+        contribution[f"priceHistogram.{_bucket(price)}"] = 1
+        if sqft:
+            price_per_sqft = price / sqft
+            contribution["pricePerSqftCount"] = 1
+            contribution["pricePerSqftSum"] = price_per_sqft
+            contribution[f"pricePerSqftHistogram.{_bucket(price_per_sqft)}"] = 1
+    listing_details = property.get("propertyListingDetails") or {}
+    status = listing_details.get("status")
+    if status:
+        contribution[f"inventoryByStatus.{status.replace('.', '_')}"] = 1
+    days_on_market = _to_float(listing_details.get("daysOnCompass"))
+    if days_on_market is not None:
+        contribution["daysOnMarketCount"] = 1
+        contribution["daysOnMarketSum"] = days_on_market
+    return contribution
+
+
+def property_areas(property: dict) -> List[Tuple[str, str]]:
+    return [(field, str(property[field])) for field in AREA_FIELDS if property.get(field)]
+
+
+def stats_updates(old: Optional[dict], new: Optional[dict]) -> Dict[str, Dict[str, float]]:
+    """Per stats document $inc maps that move the counters from ``old`` to ``new``."""
+    updates: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+    for property, sign in ((old, -1), (new, 1)):
+        if property is None:
+            continue
+        contribution = property_contribution(property)
+        for area_type, area in property_areas(property):
+            increments = updates[stats_id(area_type, area)]
+            for key, value in contribution.items():
+                increments[key] += sign * value
+    return {
+        _id: {key: value for key, value in increments.items() if value}
+        for _id, increments in updates.items()
+        if any(increments.values())
+    }
+
+
+async def apply_property_change(old: Optional[dict], new: Optional[dict], change_id: Optional[str] = None):
+    """Incrementally update stats for an inserted (old=None) or modified property.
+
+    With a ``change_id`` the update is idempotent: each stats document remembers the
+    ids it has applied, so re-running a change after a partial failure is safe.
+    """
+    now = datetime.utcnow()
+    for _id, increments in stats_updates(old, new).items():
+        area_type, area = _id.split(":", 1)
+        query = {"_id": _id}
+        update = {
+            "$inc": increments,
+            "$set": {"updatedAt": now},
+            "$setOnInsert": {"areaType": area_type, "area": area},
+        }
+        if change_id is not None:
+            query["appliedChanges"] = {"$ne": change_id}
+            update["$push"] = {"appliedChanges": {"$each": [change_id], "$slice": -APPLIED_CHANGES_KEPT}}
+        try:
+            await market_stats_collection.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # The document exists and already has this change; the upsert tried to insert it again.
+            if change_id is None:
+                raise
+
+
+def _histogram_median(histogram: Optional[Dict[str, float]]) -> Optional[float]:
+    if not histogram:
+        return None
+    buckets = sorted((float(bucket), count) for bucket, count in histogram.items() if count > 0)
+    total = sum(count for _, count in buckets)
+    if not total:
+        return None
+    seen = 0
+    for value, count in buckets:
+        seen += count
+        if seen >= total / 2:
+            return value
+    return buckets[-1][0]
+
+
+def _average(total: Optional[float], count: Optional[float]) -> Optional[float]:
+    if not count:
+        return None
+    return total / count
+
+
+def to_market_stats(document: dict) -> MarketStats:
+    return MarketStats(
+        areaType=document["areaType"],
+        area=document["area"],
+        listingCount=int(document.get("count", 0)),
+        avgPrice=_average(document.get("priceSum"), document.get("priceCount")),
+        medianPrice=_histogram_median(document.get("priceHistogram")),
+        avgPricePerSqft=_average(document.get("pricePerSqftSum"), document.get("pricePerSqftCount")),
+        medianPricePerSqft=_histogram_median(document.get("pricePerSqftHistogram")),
+        inventoryByStatus={status: int(count) for status, count in (document.get("inventoryByStatus") or {}).items() if count > 0},
+        avgDaysOnMarket=_average(document.get("daysOnMarketSum"), document.get("daysOnMarketCount")),
+        updatedAt=document.get("updatedAt"),
+    )
+
+
+async def rebuild(batch_size: int = 1000) -> int:
+    """Recompute every stats document from scratch and swap the result in."""
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+    processed = 0
+    cursor = property_collection.find({}, {field: 1 for field in STATS_FIELDS}, batch_size=batch_size)
+    async for property in cursor:
+        for _id, increments in stats_updates(None, property).items():
+            for key, value in increments.items():
+                totals[_id][key] += value
+        processed += 1
+
+    now = datetime.utcnow()
+    documents = []
+    for _id, increments in totals.items():
+        area_type, area = _id.split(":", 1)
+        document = {"_id": _id, "areaType": area_type, "area": area, "updatedAt": now}
+        for key, value in increments.items():
+            # Expand dotted counter names back into nested histogram/status maps.
+            if "." in key:
+                parent, child = key.split(".", 1)
+                document.setdefault(parent, {})[child] = value
+            else:
+                document[key] = value
+        documents.append(document)
+
+    staging = database.get_collection(f"{market_stats_collection.name}_rebuild")
+    await staging.drop()
+    for start in range(0, len(documents), batch_size):
+        await staging.insert_many(documents[start:start + batch_size])
+    if documents:
+        await staging.rename(market_stats_collection.name, dropTarget=True)
+    else:
+        await market_stats_collection.delete_many({})
+    return processed
+
+
+async def _main(argv: List[str]):
+    if len(argv) < 2 or argv[1] != "rebuild":
+        print("usage: python market_stats.py rebuild")
+        sys.exit(2)
+    processed = await rebuild()
+    print(f"rebuilt market stats from {processed} properties")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
@@ -0,0 +1,178 @@
+# migrate_property_types.py
+# Normalizes scraped string numerics in property_collection into typed values:
+#   latitude/longitude            -> float, or null when blank
+#   homeFacts.lotSize/yearBuilt   -> number, or null when blank
+#   propertyHistory[].price       -> adds a numeric priceValue next to the display string
+# Walks the collection in _id order and checkpoints after every batch, so an
+# interrupted run resumes where it stopped.
+#
+#   python migrate_property_types.py [--dry-run] [--batch-size 500] [--sleep 0.2] [--reset]
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from database import property_collection, migration_collection
+
+MIGRATION_ID = "normalize_property_types"
+_UNPARSEABLE = object()
+
+
+def _parse_number(value):
+    """Return a float/int for numeric strings, None for blanks, or _UNPARSEABLE."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return _UNPARSEABLE
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).strip().replace(",", "").replace("$", "")
+    if text in ("", "-"):
+        return None
+    try:
+        number = float(text)
+    except ValueError:
+        return _UNPARSEABLE
+    return int(number) if number.is_integer() else number
+
+
+def normalize_property(property: dict) -> Tuple[dict, int]:
+    """$set document for the fields that need converting, and how many values could not be parsed."""
+    updates = {}
+    unparseable = 0
+
+    for field in ("latitude", "longitude"):
+        value = property.get(field)
+        if value is None or isinstance(value, float):
+            continue
+        number = _parse_number(value)
+        if number is _UNPARSEABLE:
+            unparseable += 1
+        else:
+            updates[field] = None if number is None else float(number)
+
+    home_facts = property.get("homeFacts") or {}
+    for field in ("lotSize", "yearBuilt"):
+        if field not in home_facts:
+            continue
+        value = home_facts[field]
+        if not isinstance(value, str):
+            continue
+        number = _parse_number(value)
+        if number is _UNPARSEABLE:
+            unparseable += 1
+            continue
+        updates[f"homeFacts.{field}"] = number
+
+    history = property.get("propertyHistory")
+    if isinstance(history, list):
+        changed = False
+        normalized_history = []
+        for event in history:
+            if isinstance(event, dict) and "price" in event and "priceValue" not in event:
+                number = _parse_number(event["price"])
+                if number is _UNPARSEABLE:
+                    unparseable += 1
+                else:
+                    event = {**event, "priceValue": number}
+                    changed = True
+            normalized_history.append(event)
+        if changed:
+            updates["propertyHistory"] = normalized_history
+
+    return updates, unparseable
+
+
+def normalized(property: Dict) -> Dict:
+    """Copy of ``property`` with the normalize_property updates applied."""
+    updates, _ = normalize_property(property)
+    if not updates:
+        return property
+    property = dict(property)
+    for path, value in updates.items():
+        if "." in path:
+            parent, child = path.split(".", 1)
+            property[parent] = {**property[parent], child: value}
+        else:
+            property[path] = value
+    return property
+
+
+async def load_checkpoint() -> dict:
+    checkpoint = await migration_collection.find_one({"_id": MIGRATION_ID})
+    return checkpoint or {"_id": MIGRATION_ID, "lastId": None, "scanned": 0, "modified": 0, "unparseable": 0}
+
+
+async def save_checkpoint(checkpoint: dict):
+    checkpoint["updatedAt"] = datetime.utcnow()
+    await migration_collection.replace_one({"_id": MIGRATION_ID}, checkpoint, upsert=True)
+
+
+async def migrate(batch_size: int = 500, dry_run: bool = False, sleep: float = 0.0,
+                  reset: bool = False, limit: Optional[int] = None) -> dict:
+    checkpoint = await load_checkpoint()
+    if reset:
+        checkpoint = {"_id": MIGRATION_ID, "lastId": None, "scanned": 0, "modified": 0, "unparseable": 0}
+    checkpoint["completed"] = False
+    started = time.perf_counter()
+    scanned_this_run = 0
+    projection = {"latitude": 1, "longitude": 1, "homeFacts": 1, "propertyHistory": 1}
+
+    while limit is None or scanned_this_run < limit:
+        query = {} if checkpoint["lastId"] is None else {"_id": {"$gt": checkpoint["lastId"]}}
+        size = batch_size if limit is None else min(batch_size, limit - scanned_this_run)
+        batch = await property_collection.find(query, projection).sort("_id", 1).limit(size).to_list(length=size)
+        if not batch:
+            checkpoint["completed"] = True
+            break
+
+        requests = []
+        for property in batch:
+            updates, unparseable = normalize_property(property)
+            checkpoint["unparseable"] += unparseable
+            if updates:
+                requests.append(UpdateOne({"_id": property["_id"]}, {"$set": updates}))
+
+        if requests and not dry_run:
+            result = await property_collection.bulk_write(requests, ordered=False)
+            checkpoint["modified"] += result.modified_count
+        elif dry_run:
+            checkpoint["modified"] += len(requests)
+
+        checkpoint["lastId"] = batch[-1]["_id"]
+        checkpoint["scanned"] += len(batch)
+        scanned_this_run += len(batch)
+        if not dry_run:
+            await save_checkpoint(checkpoint)
+
+        elapsed = time.perf_counter() - started
+        print(f"scanned {checkpoint['scanned']} modified {checkpoint['modified']} "
+              f"({scanned_this_run / elapsed:.0f} docs/s) last _id {checkpoint['lastId']}")
+        if sleep:
+            # Throttle between batches to leave headroom for live traffic.
+            await asyncio.sleep(sleep)
+
+    if not dry_run and checkpoint["completed"]:
+        await save_checkpoint(checkpoint)
+    return checkpoint
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Normalize string numerics in property documents.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--sleep", type=float, default=0.0, help="seconds to pause between batches")
+    parser.add_argument("--limit", type=int, default=None, help="stop after scanning this many documents")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing or checkpointing")
+    parser.add_argument("--reset", action="store_true", help="ignore the saved checkpoint and start from the beginning")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    result = asyncio.run(migrate(args.batch_size, args.dry_run, args.sleep, args.reset, args.limit))
+    state = "completed" if result["completed"] else "stopped"
+    print(f"{state}{' (dry run)' if args.dry_run else ''}: scanned {result['scanned']}, "
+          f"modified {result['modified']}, unparseable values {result['unparseable']}")
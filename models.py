@@ -1,7 +1,8 @@
 # models.py
 from typing import List, Dict, Union, Any, Optional
-from pydantic import BaseModel, Field,EmailStr
+from pydantic import BaseModel, Field,EmailStr, root_validator, validator
 from enum import Enum
+from datetime import datetime
 
 class AddressList(BaseModel):
     addresses: List[str]
@@ -9,14 +10,26 @@ class AddressList(BaseModel):
 class PropertyStatus(str, Enum):
     pending = "pending"
     approved = "approved"
+    accepted = "accepted"
     rejected = "rejected"
 
+class ListingStatus(str, Enum):
+    coming_soon = "Coming Soon"
+    active = "Active"
+    sold = "Sold"
+    pending = "Pending"
+
 class RequestedProperty(BaseModel):
     id: Optional[str] = Field(alias="_id")
     address: str
     user_id: str
     status: PropertyStatus = PropertyStatus.pending
 
+class ReviewQueuePage(BaseModel):
+    items: List[RequestedProperty]
+    nextCursor: Optional[str] = None
+    counts: Dict[str, int] = {}
+
 class User(BaseModel):
     email: EmailStr
     full_name: Optional[str] = None
@@ -41,6 +54,16 @@ class TokenData(BaseModel):
     email: Optional[str] = None
     scopes: List[str] = []
 
+class PropertyHistoryEvent(BaseModel):
+    date: Optional[str] = None
+    eventAndSource: Optional[str] = None
+    price: Optional[str] = None
+    priceValue: Optional[float] = None
+    appreciation: Optional[str] = None
+
+    class Config:
+        extra = "allow"
+
 class Property(BaseModel):
     id: Optional[str] = Field(alias="_id")
     name: str
@@ -55,26 +78,38 @@ class Property(BaseModel):
     baths: Union[int, float]
     sqft: int
     comingSoon: bool
-    longitude: str
-    latitude: str
+    longitude: Optional[float] = None
+    latitude: Optional[float] = None
     description: Optional[str] = None
     propertyListingDetails: Optional[Dict[str, str]] = None
     schools: Optional[List[Dict[str, str]]] = None
     amenities: Optional[Dict[str, str]] = None
     buildingInfo: Optional[Dict[str, Union[str, None]]] = None
-    propertyHistory: Optional[List[Dict[str, str]]] = None
-    homeFacts: Optional[Dict[str, Union[str, int, None]]] = None
+    propertyHistory: Optional[List[PropertyHistoryEvent]] = None
+    homeFacts: Optional[Dict[str, Union[int, float, str, None]]] = None
     propertyInformation: Optional[Dict[str, Dict[str, Dict[str, Union[str, int]]]]] = None
     homeForSale: Optional[Any] = None
     publicRecords: Optional[Any] = None
     wishlisted: Optional[bool] = False
     user_id: Optional[Any] = None
     propertyImages: Optional[List[str]] = None
+    thumbnailUrl: Optional[str] = None
     monthlyPayment: Optional[float] = None
     downPayment: Optional[float] = None
     terms: Optional[float] = None
 
+    @validator("latitude", "longitude", pre=True)
+    def blank_coordinate_to_none(cls, value):
+        # Documents not yet migrated still store coordinates as strings, sometimes blank.
+        if isinstance(value, str) and value.strip() in ("", "-"):
+            return None
+        return value
+
     class Config:
+        # Keep values whose type already matches a Union member: without this, pydantic
+        # tries members in order and turns migrated numbers back into strings (or 2.5
+        # baths into 2).
+        smart_union = True
         json_schema_extra = {
             "example": {
                 "_id": "6661f687df143086619903c4",
@@ -91,8 +126,8 @@ class Property(BaseModel):
                 "baths": 2,
                 "sqft": 1852,
                 "comingSoon": True,
-                "longitude": "-73.9855",
-                "latitude": "40.7580",
+                "longitude": -73.9855,
+                "latitude": 40.758,
                 "description": "Description of the property.",
                 "propertyListingDetails": {
                     "status": "Active",
@@ -306,6 +341,82 @@ class Property(BaseModel):
             }
         }
 
+class SearchFilters(BaseModel):
+    address: Optional[str] = None
+    city: Optional[str] = None
+    minPrice: Optional[float] = None
+    maxPrice: Optional[float] = None
+    minBeds: Optional[int] = None
+    maxBeds: Optional[int] = None
+    minBaths: Optional[int] = None
+    maxBaths: Optional[int] = None
+    minSqft: Optional[int] = None
+    maxSqft: Optional[int] = None
+    status: Optional[List[ListingStatus]] = None
+    minLotSize: Optional[int] = None
+    maxLotSize: Optional[int] = None
+    minYearBuilt: Optional[int] = None
+    maxYearBuilt: Optional[int] = None
+    minLat: Optional[float] = None
+    maxLat: Optional[float] = None
+    minLng: Optional[float] = None
+    maxLng: Optional[float] = None
+
+class SavedSearchCreate(BaseModel):
+    name: Optional[str] = None
+    filters: SearchFilters
+
+class SavedSearch(SavedSearchCreate):
+    id: Optional[str] = Field(alias="_id")
+    user_id: str
+
+class Notification(BaseModel):
+    id: Optional[str] = Field(alias="_id")
+    user_id: str
+    saved_search_id: str
+    property_id: str
+    property_name: Optional[str] = None
+    created_at: datetime
+    read: bool = False
+
+class MarketStats(BaseModel):
+    areaType: str
+    area: str
+    listingCount: int = 0
+    avgPrice: Optional[float] = None
+    medianPrice: Optional[float] = None
+    avgPricePerSqft: Optional[float] = None
+    medianPricePerSqft: Optional[float] = None
+    inventoryByStatus: Dict[str, int] = {}
+    avgDaysOnMarket: Optional[float] = None
+    updatedAt: Optional[datetime] = None
+
+class FinancingPolicy(BaseModel):
+    annualRate: float = Field(..., ge=0, le=100)
+    termYears: float = Field(..., gt=0, le=50)
+    downPaymentPercent: float = Field(..., ge=0, le=100)
+    filters: Optional[SearchFilters] = None
+    allProperties: bool = False
+    chunkSize: int = Field(1000, ge=1, le=10000)
+
+    @root_validator(skip_on_failure=True)
+    def require_filters_or_all_properties(cls, values):
+        filters = values.get("filters")
+        has_filters = filters is not None and any(value not in (None, [], "") for value in filters.dict().values())
+        if has_filters and values.get("allProperties"):
+            raise ValueError("Pass either filters or allProperties, not both")
+        if not has_filters and not values.get("allProperties"):
+            raise ValueError("Filters are required; set allProperties to true to update every property")
+        return values
+
+class FinancingRecalculationResult(BaseModel):
+    matched: int
+    modified: int
+    skipped: int
+    chunks: int
+    seconds: float
+    propertiesPerSecond: Optional[float] = None
+
 class ContactForm(BaseModel):
     name: str = Field(..., example="John Doe")
     email: str = Field(..., example="johndoe@example.com")
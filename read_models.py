@@ -0,0 +1,82 @@
+# read_models.py
+# Read-side constructors. Properties are built without re-running the nested
+# Union/Dict validators; instead each document gets the same type normalization as
+# ingestion and migrate_property_types, so legacy scraper documents that were never
+# migrated leave every route with the types Property declares. The per-request user
+# is a slotted object rather than a pydantic model.
+import json
+from typing import Any, Dict, List, Optional, Union
+
+from fastapi.responses import JSONResponse
+
+from migrate_property_types import normalized
+from models import Property
+
+# Stored key (the alias, e.g. "_id") -> field name. construct() keeps alias keys as
+# extra attributes, so values must be passed under field names.
+_PROPERTY_FIELDS = {field.alias: name for name, field in Property.__fields__.items()}
+
+
+def property_from_db(document: Dict[str, Any]) -> Property:
+    """Build a Property from a stored document, normalized but not validated."""
+    values = {_PROPERTY_FIELDS[key]: value for key, value in normalized(document).items() if key in _PROPERTY_FIELDS}
+    if values.get("id") is not None:
+        values["id"] = str(values["id"])
+    return Property.construct(**values)
+
+
+class PropertyResponse(JSONResponse):
+    """Serializes one read-side property, or a list of them, directly.
+
+    FastAPI skips response_model validation for endpoints that return a Response,
+    which would otherwise rebuild every Property we just constructed. Routes keep
+    ``response_model`` for the OpenAPI schema.
+    """
+
+    def __init__(self, properties: Union[Property, List[Property]], **kwargs):
+        if isinstance(properties, Property):
+            content = properties.dict(by_alias=True)
+        else:
+            content = [property.dict(by_alias=True) for property in properties]
+        super().__init__(content, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        # default=str covers ObjectIds and datetimes left in nested fields.
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class AuthUser:
+    """The authenticated user attached to a request; never carries the password hash."""
+
+    __slots__ = ("id", "email", "full_name", "role", "wishlist", "referral_code", "phone_number")
+
+    def __init__(self, id: Optional[str], email: str, full_name: Optional[str] = None, role: str = "user",
+                 wishlist: Optional[List[str]] = None, referral_code: Optional[str] = None,
+                 phone_number: Optional[str] = None):
+        self.id = id
+        self.email = email
+        self.full_name = full_name
+        self.role = role
+        self.wishlist = wishlist if wishlist is not None else []
+        self.referral_code = referral_code
+        self.phone_number = phone_number
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "AuthUser":
+        _id = document.get("_id")
+        return cls(
+            id=str(_id) if _id is not None else None,
+            email=document["email"],
+            full_name=document.get("full_name"),
+            role=document.get("role", "user"),
+            wishlist=document.get("wishlist"),
+            referral_code=document.get("referral_code"),
+            phone_number=document.get("phone_number"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"AuthUser(id={self.id!r}, email={self.email!r}, role={self.role!r})"
+
@@ -0,0 +1,92 @@
+# review_queue.py
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING
+
+from database import requested_property_collection, counter_collection
+from models import PropertyStatus, RequestedProperty
+
+COUNTER_ID = "requested_properties"
+
+_ready = False
+
+
+async def ensure_indexes():
+    await requested_property_collection.create_index([("status", ASCENDING), ("_id", ASCENDING)], name="status_id")
+    await requested_property_collection.create_index(
+        [("status", ASCENDING), ("user_id", ASCENDING), ("_id", ASCENDING)], name="status_user_id"
+    )
+    document = await counter_collection.find_one({"_id": COUNTER_ID})
+    if document is None or any(status.value not in document for status in PropertyStatus):
+        await rebuild_counts()
+
+
+async def ensure_ready():
+    """Run ensure_indexes once per process before the first queue read.
+
+    Deploys also run it from create_indexes.py; this covers instances where that
+    step was skipped. Failures propagate so the queue never silently scans.
+    """
+    global _ready
+    if not _ready:
+        await ensure_indexes()
+        _ready = True
+
+
+async def rebuild_counts() -> Dict[str, int]:
+    counts = {status.value: 0 for status in PropertyStatus}
+    async for group in requested_property_collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        if group["_id"]:
+            counts[group["_id"]] = group["count"]
+    await counter_collection.replace_one({"_id": COUNTER_ID}, {"_id": COUNTER_ID, **counts}, upsert=True)
+    return counts
+
+
+async def adjust_counts(increments: Dict[str, int]):
+    """Apply deltas for writes that already happened.
+
+    Never upserts: a counter created from a delta alone would look complete to
+    ensure_indexes. Without a counter, recount from the collection instead, which
+    already includes the write being reported.
+    """
+    increments = {status: value for status, value in increments.items() if value}
+    if increments:
+        result = await counter_collection.update_one({"_id": COUNTER_ID}, {"$inc": increments})
+        if result.matched_count == 0:
+            await rebuild_counts()
+
+
+async def move(previous_status: Optional[str], new_status: str):
+    if previous_status == new_status:
+        return
+    increments = {new_status: 1}
+    if previous_status:
+        increments[previous_status] = -1
+    await adjust_counts(increments)
+
+
+async def get_counts() -> Dict[str, int]:
+    document = await counter_collection.find_one({"_id": COUNTER_ID}) or {}
+    return {status: count for status, count in document.items() if status != "_id"}
+
+
+async def fetch_page(status: str, limit: int, after: Optional[str] = None,
+                     user_id: Optional[str] = None) -> Tuple[List[RequestedProperty], Optional[str]]:
+    """One page of the queue in _id order, resuming after the ``after`` cursor."""
+    await ensure_ready()
+    query = {"status": status}
+    if user_id:
+        query["user_id"] = user_id
+    if after:
+        query["_id"] = {"$gt": after}
+    cursor = requested_property_collection.find(query).sort("_id", ASCENDING).limit(limit + 1)
+    documents = await cursor.to_list(length=limit + 1)
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = str(documents[-1]["_id"])
+    items = []
+    for document in documents:
+        document["_id"] = str(document["_id"])
+        items.append(RequestedProperty(**document))
+    return items, next_cursor
@@ -0,0 +1,248 @@
+# saved_searches.py
+import asyncio
+import bisect
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+
+from database import saved_search_collection, notification_collection
+from models import SearchFilters
+
+INDEX_TTL_SECONDS = float(os.getenv("SAVED_SEARCH_INDEX_TTL", 300))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 100))
+
+NO_LOWER_BOUND = float("-inf")
+DUPLICATE_KEY = 11000
+
+
+async def ensure_indexes():
+    # GET /savedSearches lists by user; GET /notifications lists by user, newest first.
+    await saved_search_collection.create_index("user_id", name="user_id")
+    await notification_collection.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at")
+
+
+def normalize_filters(filters: SearchFilters) -> dict:
+    """Drop unset fields and put list values in a stable order so equal searches store equal documents."""
+    normalized = filters.dict(exclude_none=True)
+    if "status" in normalized:
+        normalized["status"] = sorted(set(status.value if hasattr(status, "value") else status for status in normalized["status"]))
+        if not normalized["status"]:
+            del normalized["status"]
+    if "address" in normalized:
+        normalized["address"] = normalized["address"].strip()
+        if not normalized["address"]:
+            del normalized["address"]
+    if "city" in normalized and not normalized["city"]:
+        del normalized["city"]
+    return normalized
+
+
+def _to_float(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(str(value).replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _in_range(value, lower, upper) -> bool:
+    if lower is None and upper is None:
+        return True
+    value = _to_float(value)
+    if value is None:
+        return False
+    if lower is not None and value < lower:
+        return False
+    if upper is not None and value > upper:
+        return False
+    return True
+
+
+def matches_filters(filters: dict, property: dict) -> bool:
+    """Evaluate a normalized filter against a single property the same way /search would."""
+    if "address" in filters and filters["address"].lower() not in str(property.get("address", "")).lower():
+        return False
+    if "city" in filters and filters["city"] != property.get("city"):
+        return False
+    if "status" in filters:
+        listing_details = property.get("propertyListingDetails") or {}
+        if listing_details.get("status") not in filters["status"]:
+            return False
+    home_facts = property.get("homeFacts") or {}
+    ranges = (
+        (property.get("price"), "minPrice", "maxPrice"),
+        (property.get("beds"), "minBeds", "maxBeds"),
+        (property.get("baths"), "minBaths", "maxBaths"),
+        (property.get("sqft"), "minSqft", "maxSqft"),
+        (home_facts.get("lotSize"), "minLotSize", "maxLotSize"),
+        (home_facts.get("yearBuilt"), "minYearBuilt", "maxYearBuilt"),
+        (property.get("latitude"), "minLat", "maxLat"),
+        (property.get("longitude"), "minLng", "maxLng"),
+    )
+    for value, lower_key, upper_key in ranges:
+        if not _in_range(value, filters.get(lower_key), filters.get(upper_key)):
+            return False
+    return True
+
+
+class _RangeBucket:
+    """Saved searches sharing a city/status key, sorted by their price, beds and sqft lower bounds.
+
+    A bisect on each sorted list yields the searches whose lower bound admits the
+    listing; only the shortest of those three prefixes is checked in full.
+    """
+
+    DIMENSIONS = (("price", "minPrice"), ("beds", "minBeds"), ("sqft", "minSqft"))
+
+    def __init__(self):
+        self.lower_bounds: Dict[str, List[Tuple[float, str]]] = {field: [] for field, _ in self.DIMENSIONS}
+
+    def add(self, search_id: str, filters: dict):
+        for field, lower_key in self.DIMENSIONS:
+            lower = filters.get(lower_key)
+            bisect.insort(self.lower_bounds[field], (NO_LOWER_BOUND if lower is None else float(lower), search_id))
+
+    def remove(self, search_id: str):
+        for field in self.lower_bounds:
+            self.lower_bounds[field] = [entry for entry in self.lower_bounds[field] if entry[1] != search_id]
+
+    def __len__(self):
+        return len(self.lower_bounds["price"])
+
+    def candidates(self, property: dict) -> List[str]:
+        best = None
+        for field, _ in self.DIMENSIONS:
+            entries = self.lower_bounds[field]
+            value = _to_float(property.get(field))
+            if value is None:
+                # Only searches without a lower bound on this field can match.
+                end = bisect.bisect_right(entries, (NO_LOWER_BOUND, "\uffff"))
+            else:
+                end = bisect.bisect_right(entries, (value, "\uffff"))
+            if best is None or end < len(best):
+                best = entries[:end]
+        return [search_id for _, search_id in best or []]
+
+
+class SavedSearchIndex:
+    """In-process index of saved searches keyed by (city, status), with range buckets beneath.
+
+    Searches without a city or status are stored under a wildcard key, so matching
+    a listing touches at most four buckets no matter how many searches exist.
+    """
+
+    WILDCARD = None
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[Optional[str], Optional[str]], _RangeBucket] = {}
+        self.searches: Dict[str, dict] = {}
+        self.loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _keys(self, filters: dict) -> List[Tuple[Optional[str], Optional[str]]]:
+        city = filters.get("city", self.WILDCARD)
+        statuses = filters.get("status") or [self.WILDCARD]
+        return [(city, status) for status in statuses]
+
+    def add(self, search: dict):
+        search_id = str(search["_id"])
+        if search_id in self.searches:
+            self.remove(search_id)
+        self.searches[search_id] = search
+        for key in self._keys(search["filters"]):
+            self.buckets.setdefault(key, _RangeBucket()).add(search_id, search["filters"])
+
+    def remove(self, search_id: str):
+        search = self.searches.pop(search_id, None)
+        if search is None:
+            return
+        for key in self._keys(search["filters"]):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.remove(search_id)
+                if not len(bucket):
+                    del self.buckets[key]
+
+    def match(self, property: dict) -> List[dict]:
+        city = property.get("city")
+        status = (property.get("propertyListingDetails") or {}).get("status")
+        seen = set()
+        matched = []
+        for key in {(city, status), (city, self.WILDCARD), (self.WILDCARD, status), (self.WILDCARD, self.WILDCARD)}:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                continue
+            for search_id in bucket.candidates(property):
+                if search_id in seen:
+                    continue
+                seen.add(search_id)
+                search = self.searches[search_id]
+                if matches_filters(search["filters"], property):
+                    matched.append(search)
+        return matched
+
+    async def load(self, collection=saved_search_collection):
+        buckets, searches = self.buckets, self.searches
+        self.buckets, self.searches = {}, {}
+        try:
+            async for search in collection.find({}, {"user_id": 1, "filters": 1}):
+                self.add(search)
+        except Exception:
+            self.buckets, self.searches = buckets, searches
+            raise
+        self.loaded_at = time.monotonic()
+
+    async def ensure_fresh(self, collection=saved_search_collection):
+        # Other workers can create or delete searches, so periodically reload from Mongo.
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < INDEX_TTL_SECONDS:
+            return
+        async with self._lock:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at >= INDEX_TTL_SECONDS:
+                await self.load(collection)
+
+
+async def write_notifications(notifications: List[dict], collection=notification_collection,
+                              batch_size: int = NOTIFICATION_BATCH_SIZE):
+    """Write notifications with one insert_many per batch before returning.
+
+    Nothing is buffered in memory: on serverless deploys the instance can be frozen
+    or recycled as soon as the request finishes.
+    """
+    for start in range(0, len(notifications), batch_size):
+        try:
+            await collection.insert_many(notifications[start:start + batch_size], ordered=False)
+        except BulkWriteError as e:
+            # Duplicate _ids mean the notification was already written; re-raise anything else.
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+
+
+saved_search_index = SavedSearchIndex()
+
+
+async def notify_saved_searches(property: dict) -> int:
+    """Write a notification for every saved search the newly inserted property matches."""
+    await saved_search_index.ensure_fresh()
+    matched = saved_search_index.match(property)
+    if not matched:
+        return 0
+    now = datetime.utcnow()
+    await write_notifications([
+        {
+            "_id": f"{search['_id']}:{property['_id']}",
+            "user_id": search["user_id"],
+            "saved_search_id": str(search["_id"]),
+            "property_id": str(property["_id"]),
+            "property_name": property.get("name"),
+            "created_at": now,
+            "read": False,
+        }
+        for search in matched
+    ])
+    return len(matched)
@@ -0,0 +1,194 @@
+# test_image_proxy.py
+import asyncio
+import io
+import os
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import main
+from image_proxy import DiskLRUCache, ImageProxy, cache_key, proxy_url
+
+
+class CountingHandler(SimpleHTTPRequestHandler):
+    requests = []
+    delay = 0.0
+
+    def do_GET(self):
+        CountingHandler.requests.append(self.path)
+        time.sleep(CountingHandler.delay)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def make_image(path, color, size=(1200, 900)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "JPEG")
+    path.write_bytes(buffer.getvalue())
+
+
+@pytest.fixture
+def origin(tmp_path):
+    root = tmp_path / "origin"
+    root.mkdir()
+    for name, color in (("red.jpg", "red"), ("green.jpg", "green"), ("blue.jpg", "blue")):
+        make_image(root / name, color)
+    CountingHandler.requests = []
+    CountingHandler.delay = 0.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(CountingHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def proxy(tmp_path, monkeypatch):
+    proxy = ImageProxy(cache=DiskLRUCache(str(tmp_path / "cache")), workers=0)
+    monkeypatch.setattr(main, "image_proxy", proxy)
+    return proxy
+
+
+def test_fetch_cache_hit_and_not_modified(origin, proxy):
+    client = TestClient(main.app)
+    url = proxy_url(f"{origin}/red.jpg")
+
+    first = client.get(url, headers={"accept": "image/webp"})
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/webp"
+    with Image.open(io.BytesIO(first.content)) as image:
+        assert image.size == (320, 240)
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith('W/')
+
+    second = client.get(url, headers={"accept": "image/webp"})
+    assert second.status_code == 200
+    assert second.headers["etag"] == etag
+    assert second.content == first.content
+    assert CountingHandler.requests == ["/red.jpg"]
+
+    not_modified = client.get(url, headers={"accept": "image/webp", "if-none-match": etag})
+    assert not_modified.status_code == 304
+    assert CountingHandler.requests == ["/red.jpg"]
+
+
+def test_rejects_unsigned_urls(origin, proxy):
+    client = TestClient(main.app)
+    url = proxy_url(f"{origin}/red.jpg").replace("/images/thumb/", "/images/thumb/0")
+    assert client.get(url).status_code == 403
+    assert CountingHandler.requests == []
+
+
+def test_lru_eviction(origin, tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "small-cache"), max_bytes=1)
+    proxy = ImageProxy(cache=cache, workers=0)
+
+    async def render_all():
+        paths = []
+        for name in ("red.jpg", "green.jpg", "blue.jpg"):
+            path, _, _ = await proxy.get(f"{origin}/{name}", "thumb", "webp")
+            paths.append(path)
+        return paths
+
+    paths = asyncio.run(render_all())
+    # Only the most recently written entry survives a one-byte budget.
+    assert len(cache.entries) == 1
+    assert cache.total_bytes == sum(size for _, _, size in cache.entries.values())
+    assert not any((tmp_path / "small-cache" / p.rsplit("/", 1)[-1]).exists() for p in paths[:-1])
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "cache"), max_bytes=20)
+    cache.put("a", b"a" * 10, "webp")
+    cache.put("b", b"b" * 10, "webp")
+    assert cache.get("a") is not None
+    cache.put("c", b"c" * 10, "webp")
+
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+    assert sorted(p.name.split("-")[0] for p in (tmp_path / "cache").iterdir()) == ["a", "c"]
+    # A fresh instance rebuilds the same index from disk.
+    assert set(DiskLRUCache(str(tmp_path / "cache"), max_bytes=20).entries) == {"a", "c"}
+
+
+def test_cancelled_waiter_does_not_cancel_shared_render(origin, proxy):
+    CountingHandler.delay = 0.3
+
+    async def scenario():
+        url = f"{origin}/green.jpg"
+        first = asyncio.ensure_future(proxy.get(url, "thumb", "webp"))
+        second = asyncio.ensure_future(proxy.get(url, "thumb", "webp"))
+        # Wait until both callers are blocked on the same in-flight render.
+        while len(CountingHandler.requests) < 1:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        assert cache_key(url, "thumb", "webp") in proxy._inflight
+        first.cancel()
+        return await second
+
+    path, etag, media_type = asyncio.run(scenario())
+    assert media_type == "image/webp"
+    assert CountingHandler.requests == ["/green.jpg"]
+
+
+def test_concurrent_puts_of_one_key(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "cache"))
+    errors = []
+
+    def put():
+        try:
+            for _ in range(50):
+                cache.put("a", b"a" * 1000, "bin")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert cache.read("a") == b"a" * 1000
+    assert not any(p.name.endswith(".tmp") for p in (tmp_path / "cache").iterdir())
+
+
+def test_variants_share_one_origin_fetch(origin, proxy):
+    CountingHandler.delay = 0.2
+
+    async def scenario():
+        url = f"{origin}/blue.jpg"
+        return await asyncio.gather(proxy.get(url, "thumb", "webp"), proxy.get(url, "thumb", "jpeg"))
+
+    (_, _, webp), (_, _, jpeg) = asyncio.run(scenario())
+    assert (webp, jpeg) == ("image/webp", "image/jpeg")
+    assert CountingHandler.requests == ["/blue.jpg"]
+
+
+def test_evicted_between_get_and_send_is_rerendered(origin, proxy, monkeypatch):
+    client = TestClient(main.app)
+    url = proxy_url(f"{origin}/red.jpg")
+    original_get = proxy.get
+    calls = []
+
+    async def get_then_evict(*args):
+        # Another request evicts the file right after the first lookup.
+        path, etag, media_type = await original_get(*args)
+        if not calls:
+            os.remove(path)
+        calls.append(path)
+        return path, etag, media_type
+
+    monkeypatch.setattr(proxy, "get", get_then_evict)
+    response = client.get(url, headers={"accept": "image/webp"})
+    assert response.status_code == 200
+    with Image.open(io.BytesIO(response.content)) as image:
+        assert image.size == (320, 240)
+    assert len(calls) == 2